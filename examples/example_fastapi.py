@@ -1,13 +1,23 @@
 import logging.config
+import logging.handlers
+import queue
 
 import httpx
 from fastapi import FastAPI, WebSocket
 from fastapi.responses import JSONResponse, PlainTextResponse
+from uvicorn.logging import DefaultFormatter
 
-from log_correlation_asgi import get_logging_dict, LogCorrelationMiddleware
+from log_correlation_asgi import get_logging_dict, LogCorrelationMiddleware, make_buffered_stderr_handler
 
 
 CORRELATION_ID_HEADER_NAME = "span_id"
+LOG_FORMAT = (
+    "%(asctime)s %(levelname)s %(service_name)s %(correlation_id)s %(ip_address)s "
+    "%(user)s %(method)s %(path)s %(message)s %(query_string)s %(body)s"
+)
+
+# Records are put to the queue in request context and written to stderr by a background thread.
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
 
 
 def _get_username(headers, user):
@@ -28,6 +38,16 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def start_log_listener():
+    log_listener.start()
+
+
+@app.on_event("shutdown")
+async def stop_log_listener():
+    log_listener.stop()
+
+
 @app.get("/json/")
 async def get_json():
     return JSONResponse(content={"test": 1})
@@ -57,38 +77,36 @@ async def get_ws(websocket: WebSocket):
 logging_config = {
     "version": 1,
     "disable_existing_loggers": False,
-    "formatters": {
-        "default": {
-            "()": "uvicorn.logging.DefaultFormatter",
-            "fmt": "%(asctime)s %(levelname)s %(service_name)s %(correlation_id)s %(ip_address)s "
-            "%(user)s %(method)s %(path)s %(message)s %(query_string)s %(body)s",
-        },
-    },
     "filters": {
         "log_correlation_filter": {
             "()": "log_correlation_asgi.ContextDataFilter",
         },
     },
     "handlers": {
-        "console": {
+        "queue": {
+            # The filter must run here, in request context, not in the listener thread
             "filters": ["log_correlation_filter"],
-            "formatter": "default",
-            "class": "logging.StreamHandler",
-            "stream": "ext://sys.stderr",
+            "()": "logging.handlers.QueueHandler",
+            "queue": log_queue,
         },
     },
     "loggers": {
         "": {"level": "INFO"},
         "middleware_logger": {
-            "handlers": ["console"],
+            "handlers": ["queue"],
             "level": "INFO",
             "propagate": True,
         },
         "app": {
-            "handlers": ["console"],
+            "handlers": ["queue"],
             "level": "INFO",
             "propagate": True,
         },
     },
 }
 logging.config.dictConfig(logging_config)
+
+# Created after dictConfig, which closes all existing handlers
+console_handler = make_buffered_stderr_handler(flush_interval=1.0)
+console_handler.setFormatter(DefaultFormatter(fmt=LOG_FORMAT))
+log_listener = logging.handlers.QueueListener(log_queue, console_handler)
@@ -1,2 +1,3 @@
-from .filter import ContextDataFilter
+from .filter import ContextDataFilter, ContextDataLogger, install_context_logger_class
+from .handler import BufferedStreamHandler, make_buffered_stderr_handler
 from .middleware import get_logging_dict, LogCorrelationMiddleware
@@ -0,0 +1,88 @@
+import logging
+import os
+import sys
+import threading
+from typing import Optional, TextIO
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """
+    Stream handler that does not flush the stream after every record.
+
+    The stream is flushed every flush_interval seconds from a background thread and immediately
+    after records with level flush_level or higher. logging.shutdown flushes it on interpreter exit.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        flush_interval: float = 1.0,
+        flush_level: int = logging.ERROR,
+        close_stream: bool = False,
+    ) -> None:
+        """
+        :param stream: Stream to write to, sys.stderr by default.
+        :param flush_interval: Seconds between periodic flushes.
+        :param flush_level: Records of that level or higher are flushed immediately.
+        :param close_stream: Close the stream when the handler is closed, for streams opened for this handler.
+        """
+        super().__init__(stream)
+        self.flush_level = flush_level
+        self._close_stream = close_stream
+        # Not self._closed, logging.Handler uses that name itself
+        self._stop_flushing = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True)
+        self._flusher.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            if record.levelno >= self.flush_level:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:  # pylint: disable=W0703
+            self.handleError(record)
+
+    def flush(self) -> None:
+        if not self._stop_flushing.is_set():
+            super().flush()
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            self.flush()
+            self._stop_flushing.set()
+            if self._close_stream:
+                self.stream.close()
+        finally:
+            self.release()
+        super().close()
+
+    def _flush_periodically(self, flush_interval: float) -> None:
+        while not self._stop_flushing.wait(flush_interval):
+            self.flush()
+
+
+def make_buffered_stderr_handler(
+    flush_interval: float = 1.0,
+    flush_level: int = logging.ERROR,
+    buffer_size: int = 65536,
+) -> BufferedStreamHandler:
+    """
+    Returns a handler writing to stderr through a buffer of buffer_size bytes.
+
+    Falls back to sys.stderr itself if it has no file descriptor (e.g. replaced by a test runner).
+    Note that logging.config.dictConfig closes all existing handlers, create this one after it or in it.
+    """
+    try:
+        stream = open(  # pylint: disable=R1732
+            os.dup(sys.stderr.fileno()),
+            "w",
+            buffering=buffer_size,
+            encoding=sys.stderr.encoding,
+            errors="backslashreplace",
+        )
+    except (AttributeError, OSError, ValueError):
+        return BufferedStreamHandler(sys.stderr, flush_interval=flush_interval, flush_level=flush_level)
+    return BufferedStreamHandler(stream, flush_interval=flush_interval, flush_level=flush_level, close_stream=True)
@@ -1,13 +1,15 @@
+import functools
 import json
 import logging
+import os
 import re
 from contextvars import ContextVar
+from types import MappingProxyType
 from typing import Callable, List, Optional, Pattern, Union, Any, Dict
 from uuid import uuid4
 from urllib.parse import parse_qs
 
 
-_logging_dict_ctx_var: ContextVar[dict] = ContextVar("logging_dict", default=dict())
 LOGGED_FIELDS = (
     "service_name",
     "correlation_id",
@@ -19,11 +21,23 @@ LOGGED_FIELDS = (
     "ip_address",
     "user",
 )
+# Used outside of requests and for excluded paths, read-only so that writes don't leak to other requests.
+_logging_dict_ctx_var: ContextVar[dict] = ContextVar(
+    "logging_dict", default=MappingProxyType(dict.fromkeys(LOGGED_FIELDS))  # type: ignore[arg-type]
+)
+_get_ctx = _logging_dict_ctx_var.get
+_BOM_OR_NULL_FIRST_BYTES = frozenset((0x00, 0xEF, 0xFE, 0xFF))
+_DEFAULT_REGEX_FLAGS = re.compile("").flags
+# Same query strings are repeated often (pagination, polling), long ones are not cached to bound memory.
+_CACHED_QUERY_STRING_MAX_LENGTH = 1024
 
 
 def get_logging_dict() -> dict:
-    """Returns a dictionary containing request-specific data."""
-    return _logging_dict_ctx_var.get()
+    """
+    Returns a dictionary containing request-specific data.
+    Outside of requests and for excluded paths it is read-only with all fields set to None.
+    """
+    return _get_ctx()
 
 
 class LogCorrelationMiddleware:  # pylint: disable=R0902, R0903
@@ -43,6 +57,7 @@ class LogCorrelationMiddleware:  # pylint: disable=R0902, R0903
         no_args_paths: Optional[List[str]] = None,
         get_request_message: Optional[str] = "Got request",
         send_response_message: Optional[str] = "Sent response",
+        batch_records: bool = False,
     ) -> None:
         """
         :param app: ASGI application instance.
@@ -51,10 +66,12 @@ class LogCorrelationMiddleware:  # pylint: disable=R0902, R0903
         :param get_remote_addr: Callable to get remote address from headers dict or header name (str). TODO: multi dict
         :param get_username: Callable to get remote address from headers dict or scope["user"] (if filled previously).
         :param logger_name: Name of logger used to log http/ws requests.
-        :param excluded_paths: Paths that won't be logged.
+        :param excluded_paths: Paths that won't be logged, request-specific data is not set for them
+            (get_logging_dict returns read-only dict with all fields set to None).
         :param no_args_paths: Paths that will be logged without query string and body.
         :param get_request_message: A string to distinguish a request from a response in log.
         :param send_response_message: A string to distinguish a request from a response in log.
+        :param batch_records: Log http request together with response in one record instead of two.
         """
         self.app = app
         self.service_name = service_name
@@ -63,138 +80,243 @@ class LogCorrelationMiddleware:  # pylint: disable=R0902, R0903
         self.get_username = get_username
         self.logger = logging.getLogger(logger_name or __name__)
 
-        self._excluded_paths: List[Pattern[str]]
-        if excluded_paths:
-            self._excluded_paths = [re.compile(path) for path in excluded_paths]
-        else:
-            self._excluded_paths = []
+        self._excluded_paths = _compile_paths(excluded_paths)
+        self._no_args_paths = _compile_paths(no_args_paths)
 
-        self._no_args_paths: List[Pattern[str]]
-        if no_args_paths:
-            self._no_args_paths = [re.compile(path) for path in no_args_paths]
-        else:
-            self._no_args_paths = []
+        # Copied for every request, fields that don't depend on the request are filled once here.
+        self._logging_dict_template: Dict[str, Any] = dict.fromkeys(LOGGED_FIELDS)
+        self._logging_dict_template["service_name"] = service_name
+
+        self._correlation_id_key = self.correlation_id_header.encode("latin-1")
+        self._remote_addr_header = get_remote_addr.lower() if isinstance(get_remote_addr, str) else None
+        # Headers read by middleware itself, raw lowercase names mapped to headers dict keys.
+        self._wanted_headers = {
+            name.encode("latin-1"): name
+            for name in (self.correlation_id_header, self._remote_addr_header, "content-length")
+            if name is not None
+        }
+
+        # Configuration doesn't change between requests, so branches on it are resolved once here.
+        self._get_remote_addr_from_headers = get_remote_addr if callable(get_remote_addr) else None
+        self._needs_headers_dict = self._get_remote_addr_from_headers is not None or get_username is not None
 
         self._get_request_message = get_request_message if get_request_message is not None else ""
         self._send_response_message = send_response_message if send_response_message is not None else ""
+        self.batch_records = batch_records
+        self._batched_message = f"{self._get_request_message} / {self._send_response_message}"
+
+    async def __call__(self, scope, receive, send) -> None:  # pylint: disable=R0912, R0914
+        def log_request(extra: Dict[str, str]) -> None:
+            """Logs request or keeps its extra to log together with response if records are batched."""
+            nonlocal request_data
+            if batch_records:
+                request_data = extra
+            else:
+                logger.info(get_request_message, extra=extra)
 
-    async def __call__(self, scope, receive, send) -> None:
         async def proxy_receive():
             """Replaces receive to intercept messages."""
             message = await receive()
 
             if message["type"] == "http.request":
-                body.append(message.get("body", b""))
+                if not is_no_args_path:
+                    body.extend(message.get("body", b""))
 
                 if not message.get("more_body", False):
                     extra = {}
                     if not is_no_args_path:
                         extra["query_string"] = query_string_to_json(scope["query_string"])
-                        extra["body"] = _decode(b"".join(body))
+                        extra["body"] = _decode(body)
 
-                    self.logger.info(self._get_request_message, extra=extra)
+                    log_request(extra)
                     body.clear()
 
             return message
 
         async def proxy_send(message) -> None:
             """Replaces send to intercept messages."""
+            nonlocal request_data
             if message["type"] == "http.response.start":
                 # Set correlation id header
-                key = self.correlation_id_header.encode("latin-1")
-                value = get_logging_dict()["correlation_id"].encode("latin-1")
-                headers = message["headers"]
-                headers.append([key, value])
+                message["headers"].append([correlation_id_key, logging_data_dict["correlation_id"].encode("latin-1")])
             elif message["type"] == "http.response.body":
-                body.append(message.get("body", b""))
+                if not is_no_args_path:
+                    body.extend(message.get("body", b""))
 
                 if not message.get("more_body", False):
                     extra = {}
                     if not is_no_args_path:
-                        extra["body"] = _decode(b"".join(body))
+                        extra["body"] = _decode(body)
 
-                    self.logger.info(self._send_response_message, extra=extra)
+                    if request_data is not None:
+                        logger.info(batched_message, extra=_merge_batched_data(request_data, extra))
+                        request_data = None
+                    else:
+                        logger.info(send_response_message, extra=extra)
                     body.clear()
 
             await send(message)
 
+        async def proxy_send_header_only(message) -> None:
+            """Replaces send to only set correlation id header."""
+            if message["type"] == "http.response.start":
+                message["headers"].append([correlation_id_key, logging_data_dict["correlation_id"].encode("latin-1")])
+
+            await send(message)
+
         # And now the async def __call__ goes.
         if scope["type"] not in ("http", "websocket"):
             await self.app(scope, receive, send)
             return
 
-        logging_data_dict = {
-            "service_name": self.service_name,
-            "correlation_id": None,
-            "request_id": str(uuid4()),
-            "method": scope.get("method"),
-            "path": scope.get("path"),
-            "body": None,
-            "query_string": None,
-            "ip_address": None,
-            "user": None,
-        }
+        if _search_any(self._excluded_paths, scope["path"]):
+            await self.app(scope, receive, send)
+            return
 
-        _logging_data = _logging_dict_ctx_var.set(logging_data_dict)
+        logging_data_dict = self._logging_dict_template.copy()
+        logging_data_dict["request_id"] = _new_id()
+        logging_data_dict["method"] = scope.get("method")
+        logging_data_dict["path"] = scope.get("path")
 
-        if any(pattern.search(scope["path"]) for pattern in self._excluded_paths):
-            try:
-                await self.app(scope, receive, send)
-            finally:
-                _logging_dict_ctx_var.reset(_logging_data)
-            return
+        _logging_data = _logging_dict_ctx_var.set(logging_data_dict)
 
-        is_no_args_path = any(pattern.search(scope["path"]) for pattern in self._no_args_paths)
+        # Bound to locals so that proxy_receive and proxy_send don't look them up on self per message
+        logger = self.logger
+        get_request_message = self._get_request_message
+        send_response_message = self._send_response_message
+        correlation_id_key = self._correlation_id_key
+        # Websocket connections may last for hours, they are logged right away
+        batch_records = self.batch_records and scope["type"] == "http"
+        batched_message = self._batched_message
+        # Request data waiting to be logged together with response if records are batched
+        request_data: Optional[Dict[str, str]] = None
+
+        # Extra data is not built and messages are not intercepted if requests won't be logged
+        log_enabled = logger.isEnabledFor(logging.INFO)
+        is_no_args_path = _search_any(self._no_args_paths, scope["path"])
+
+        body = bytearray()
+        # Full headers dict is built only for user callables that expect it.
+        if self._needs_headers_dict:
+            headers = headers_to_dict(scope["headers"])
+        else:
+            headers = find_headers(scope["headers"], self._wanted_headers)
 
-        body: List[bytes] = []
-        headers = headers_to_dict(scope["headers"])
-        logging_data_dict["correlation_id"] = headers.get(self.correlation_id_header, str(uuid4()))
+        correlation_id = headers.get(self.correlation_id_header)
+        logging_data_dict["correlation_id"] = correlation_id if correlation_id is not None else str(uuid4())
 
-        if isinstance(self.get_remote_addr, str):
-            logging_data_dict["ip_address"] = headers.get(self.get_remote_addr)
-        elif callable(self.get_remote_addr):
-            logging_data_dict["ip_address"] = self.get_remote_addr(headers)
+        if self._remote_addr_header is not None:
+            logging_data_dict["ip_address"] = headers.get(self._remote_addr_header)
+        elif self._get_remote_addr_from_headers is not None:
+            logging_data_dict["ip_address"] = self._get_remote_addr_from_headers(headers)
 
-        if self.get_username:
+        if self.get_username is not None:
             logging_data_dict["user"] = self.get_username(headers=headers, user=scope.get("user"))
 
-        _logging_dict_ctx_var.set(logging_data_dict)
-
-        if not headers.get("content-length", 0):
+        if log_enabled and not headers.get("content-length"):
             extra = {}
             if not is_no_args_path:
                 extra["query_string"] = query_string_to_json(scope["query_string"])
 
-            self.logger.info(self._get_request_message, extra=extra)
+            log_request(extra)
 
         try:
-            await self.app(scope, proxy_receive, proxy_send)
+            if log_enabled:
+                await self.app(scope, proxy_receive, proxy_send)
+            else:
+                # Bodies are neither logged nor captured
+                await self.app(scope, receive, proxy_send_header_only)
         finally:
+            # No response body was sent (app error or disconnect), request is still logged
+            if request_data is not None:
+                logger.info(get_request_message, extra=request_data)
             _logging_dict_ctx_var.reset(_logging_data)
 
 
+def _new_id() -> str:
+    """Returns random 128-bit hex id, cheaper than str(uuid4())."""
+    return os.urandom(16).hex()
+
+
+def _merge_batched_data(request_data: Dict[str, str], response_data: Dict[str, str]) -> Dict[str, str]:
+    """Merges request and response data logged in one record, bodies are joined like messages."""
+    data = {**request_data, **response_data}
+    if "body" in response_data:
+        data["body"] = f"{request_data.get('body') or '-'} / {response_data['body'] or '-'}"
+    return data
+
+
+def _compile_paths(paths: Optional[List[str]]) -> List[Pattern[str]]:
+    """
+    Compiles path patterns, into a single alternation regex if that doesn't change their meaning.
+    Patterns with groups (renumbered backreferences, duplicate names) or inline global flags are kept separate.
+    """
+    patterns = [re.compile(path) for path in paths or ()]
+    if len(patterns) > 1 and all(pattern.groups == 0 and pattern.flags == _DEFAULT_REGEX_FLAGS for pattern in patterns):
+        return [re.compile("|".join(f"(?:{pattern.pattern})" for pattern in patterns))]
+    return patterns
+
+
+def _search_any(patterns: List[Pattern[str]], path: str) -> bool:
+    """Returns True if any of patterns matches path."""
+    for pattern in patterns:
+        if pattern.search(path):
+            return True
+    return False
+
+
 def headers_to_dict(scope_headers: list) -> Dict[str, Any]:
     """Converts list of tuples of headers to dict."""
-    headers: Dict[str, Any] = {}
+    values: Dict[str, List[str]] = {}
     for raw_key, raw_value in scope_headers:
-        key = raw_key.decode("latin-1").lower()
-        value = raw_value.decode("latin-1")
-        if key in headers:
-            headers[key] = headers[key] + ", " + value
-        else:
-            headers[key] = value
+        values.setdefault(raw_key.decode("latin-1").lower(), []).append(raw_value.decode("latin-1"))
+    return {key: value[0] if len(value) == 1 else ", ".join(value) for key, value in values.items()}
+
+
+def find_headers(scope_headers: list, wanted: Dict[bytes, str]) -> Dict[str, str]:
+    """Converts only wanted headers to dict, wanted maps raw lowercase header names to dict keys."""
+    headers: Dict[str, str] = {}
+    for raw_key, raw_value in scope_headers:
+        key = wanted.get(raw_key.lower())
+        if key is not None:
+            value = raw_value.decode("latin-1")
+            headers[key] = headers[key] + ", " + value if key in headers else value
     return headers
 
 
 def query_string_to_json(query_string: bytes) -> Optional[str]:
     """Converts query string to json."""
+    if not query_string:
+        return "{}"
+    if len(query_string) <= _CACHED_QUERY_STRING_MAX_LENGTH:
+        return _cached_query_string_to_json(query_string)
+    return _query_string_to_json(query_string)
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_query_string_to_json(query_string: bytes) -> str:
+    """Cached version of _query_string_to_json."""
+    return _query_string_to_json(query_string)
+
+
+def _query_string_to_json(query_string: bytes) -> str:
+    """Converts non-empty query string to json."""
     qs_dict = parse_qs(query_string.decode("latin-1"))
     return json.dumps(qs_dict)
 
 
 def _decode(data: bytes) -> str:
     """Returns string representation of data."""
+    if not data:
+        return ""
+
+    # json.detect_encoding can only pick something other than utf-8 for a BOM or a null byte at the start
+    if data[0] not in _BOM_OR_NULL_FIRST_BYTES and (len(data) < 2 or data[1]):
+        encoding = "utf-8"
+    else:
+        encoding = json.detect_encoding(data)
+
     try:
-        return data.decode(json.detect_encoding(data), "surrogatepass")
+        return data.decode(encoding, "surrogatepass")
     except (TypeError, UnicodeDecodeError):
         return "Can not decode"
@@ -0,0 +1,63 @@
+import logging
+
+from log_correlation_asgi import ContextDataFilter, ContextDataLogger
+from log_correlation_asgi.middleware import _logging_dict_ctx_var
+
+
+class ListHandler(logging.Handler):
+    """Keeps emitted records in a list."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def test_context_data_logger_adds_context():
+    logger = ContextDataLogger("test_filter")
+    handler = ListHandler()
+    logger.addHandler(handler)
+
+    token = _logging_dict_ctx_var.set({"correlation_id": "cid", "user": "alice", "tenant": "t1", "path": None})
+    try:
+        logger.warning("hi", extra={"user": "bob", "body": ""})
+    finally:
+        _logging_dict_ctx_var.reset(token)
+
+    record = handler.records[0]
+    assert record.correlation_id == "cid"
+    assert record.tenant == "t1"
+    assert record.user == "bob"
+    assert record.body == ""
+    assert record.path == "-"
+
+
+def test_context_data_logger_without_context():
+    logger = ContextDataLogger("test_filter")
+    handler = ListHandler()
+    logger.addHandler(handler)
+
+    logger.warning("hi", extra={"user": None})
+
+    assert handler.records[0].user == "-"
+    assert handler.records[0].correlation_id == "-"
+
+
+def test_context_data_filter_adds_context():
+    logger = logging.getLogger("test_filter_filter")
+    handler = ListHandler()
+    handler.addFilter(ContextDataFilter())
+    logger.addHandler(handler)
+
+    token = _logging_dict_ctx_var.set({"correlation_id": "cid", "tenant": "t1"})
+    try:
+        logger.warning("hi", extra={"user": None})
+    finally:
+        _logging_dict_ctx_var.reset(token)
+
+    record = handler.records[0]
+    assert record.correlation_id == "cid"
+    assert record.tenant == "t1"
+    assert record.user == "-"
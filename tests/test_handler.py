@@ -0,0 +1,67 @@
+import logging
+import logging.config
+
+from log_correlation_asgi import BufferedStreamHandler, make_buffered_stderr_handler
+
+
+def _make_logger(handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger("test_handler")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def test_flushes_on_error_and_close(tmp_path):
+    path = tmp_path / "log.txt"
+    handler = BufferedStreamHandler(
+        open(path, "w", buffering=65536, encoding="utf-8"),  # pylint: disable=R1732
+        flush_interval=60,
+        close_stream=True,
+    )
+    logger = _make_logger(handler)
+
+    logger.info("info")
+    assert path.read_text() == ""
+
+    logger.error("error")
+    assert path.read_text() == "info\nerror\n"
+
+    logger.info("last")
+    handler.close()
+    assert path.read_text() == "info\nerror\nlast\n"
+    assert handler.stream.closed
+
+
+def test_closed_by_dict_config():
+    handler = make_buffered_stderr_handler(flush_interval=0.01)
+    errors = []
+    handler.handleError = errors.append
+
+    logging.config.dictConfig({"version": 1, "disable_existing_loggers": False})
+
+    handler._flusher.join(timeout=1)  # pylint: disable=W0212
+    assert not handler._flusher.is_alive()  # pylint: disable=W0212
+    assert handler.stream.closed
+
+    # logging.shutdown flushes and closes handlers again on exit
+    handler.flush()
+    handler.close()
+    assert not errors
+
+
+def test_created_by_dict_config(capfd):
+    logging.config.dictConfig(
+        {
+            "version": 1,
+            "disable_existing_loggers": False,
+            "handlers": {"buffered": {"()": "log_correlation_asgi.make_buffered_stderr_handler"}},
+            "loggers": {"test_handler": {"handlers": ["buffered"], "level": "INFO", "propagate": False}},
+        }
+    )
+    logger = logging.getLogger("test_handler")
+    handler = logger.handlers[0]
+
+    logger.info("info")
+    handler.close()
+    assert capfd.readouterr().err == "info\n"
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import re
+
+import pytest
+
+from log_correlation_asgi import get_logging_dict, LogCorrelationMiddleware
+from log_correlation_asgi.middleware import _compile_paths, _search_any
+
+
+def _http_scope(path: str = "/", headers: list = None) -> dict:
+    return {"type": "http", "method": "POST", "path": path, "headers": headers or [], "query_string": b""}
+
+
+def _run(middleware, scope: dict, messages: list) -> list:
+    """Runs middleware with messages to receive, returns sent messages."""
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return sent
+
+
+async def _echo_app(scope, receive, send):
+    message = await receive()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": message["body"]})
+
+
+def test_compile_paths_inline_flags_stay_separate():
+    patterns = _compile_paths(["(?i)/Health", "/metrics"])
+
+    assert len(patterns) == 2
+    assert _search_any(patterns, "/HEALTH")
+    assert _search_any(patterns, "/metrics")
+    assert not _search_any(patterns, "/METRICS")
+
+
+def test_compile_paths_groups_stay_separate():
+    patterns = _compile_paths([r"^/(a)\1", r"^/(b)\1", "^/(?P<x>c)", "^/(?P<x>d)"])
+
+    assert len(patterns) == 4
+    assert _search_any(patterns, "/bb")
+    assert _search_any(patterns, "/d")
+    assert not _search_any(patterns, "/ab")
+
+
+def test_compile_paths_without_groups_are_combined():
+    patterns = _compile_paths(["^/health", "^/metrics", "(?:^/ping)"])
+
+    assert patterns == [re.compile("(?:^/health)|(?:^/metrics)|(?:(?:^/ping))")]
+    assert _search_any(patterns, "/metrics/")
+    assert not _search_any(patterns, "/api/health")
+
+
+def test_compile_paths_empty():
+    assert _compile_paths(None) == []
+    assert not _search_any(_compile_paths([]), "/health")
+
+
+def test_correlation_id_header_set_at_response_start():
+    async def app(scope, receive, send):
+        get_logging_dict()["correlation_id"] = "changed"
+        await _echo_app(scope, receive, send)
+
+    middleware = LogCorrelationMiddleware(app, correlation_id_header="X-Cid")
+    sent = _run(middleware, _http_scope(headers=[(b"x-cid", b"original")]), [{"type": "http.request", "body": b""}])
+
+    assert sent[0]["headers"] == [[b"x-cid", b"changed"]]
+
+
+def test_excluded_path_has_read_only_logging_dict():
+    logging_dicts = []
+
+    async def app(scope, receive, send):
+        logging_dicts.append(get_logging_dict())
+        await _echo_app(scope, receive, send)
+
+    middleware = LogCorrelationMiddleware(app, excluded_paths=["^/health"])
+    _run(middleware, _http_scope("/health"), [{"type": "http.request", "body": b""}])
+
+    assert logging_dicts[0]["correlation_id"] is None
+    with pytest.raises(TypeError):
+        logging_dicts[0]["correlation_id"] = "leaked"
+
+
+def test_batch_records_http(caplog):
+    caplog.set_level(logging.INFO, logger="test_middleware")
+
+    async def app(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"resp"})
+
+    middleware = LogCorrelationMiddleware(app, logger_name="test_middleware", batch_records=True)
+    scope = _http_scope(headers=[(b"content-length", b"3")])
+    _run(middleware, scope, [{"type": "http.request", "body": b"req"}])
+
+    assert [record.getMessage() for record in caplog.records] == ["Got request / Sent response"]
+    assert caplog.records[0].body == "req / resp"
+
+
+def test_batch_records_app_error(caplog):
+    caplog.set_level(logging.INFO, logger="test_middleware")
+
+    async def app(scope, receive, send):
+        await receive()
+        raise RuntimeError
+
+    middleware = LogCorrelationMiddleware(app, logger_name="test_middleware", batch_records=True)
+    scope = _http_scope(headers=[(b"content-length", b"3")])
+    with pytest.raises(RuntimeError):
+        _run(middleware, scope, [{"type": "http.request", "body": b"req"}])
+
+    assert [record.getMessage() for record in caplog.records] == ["Got request"]
+    assert caplog.records[0].body == "req"
+
+
+def test_batch_records_websocket_logged_immediately(caplog):
+    caplog.set_level(logging.INFO, logger="test_middleware")
+
+    async def app(scope, receive, send):
+        await receive()
+        logging.getLogger("test_middleware").info("ws alive")
+
+    middleware = LogCorrelationMiddleware(app, logger_name="test_middleware", batch_records=True)
+    scope = {"type": "websocket", "path": "/ws", "headers": [], "query_string": b""}
+    _run(middleware, scope, [{"type": "websocket.connect"}])
+
+    assert [record.getMessage() for record in caplog.records] == ["Got request", "ws alive"]